@@ -1,43 +1,172 @@
 from collections import Counter
-from functools import reduce
 import matplotlib.pyplot as plt
 import numpy as np
+from itertools import chain, islice
 from utility.author import Author
+from utility.sketch import TopKSketches
+from utility.graphemes import count_graphemes, count_emoji, count_emoji_by, split_graphemes
+from utility.filtering import TokenCounts, compile_stop_mask, detect_language, get_stop_lists
 from utility.stop_words import STOP_WORDS
-from utility.stop_chars import STOP_CHARS
-from utility.bca import get_bcp
 from datetime import timedelta
+from pathlib import Path
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-import operator
-from functools import reduce
 
 
-def analyse_convos(convo, convo_times):
-    """Work in progress. Supposed to find most negative and most positive message in each conversation.
+def assign_convo_idx(convo, convo_times):
+    """Add the index of the conversation each message belongs to.
 
-    :param convo:
-    :param convo_times:
-    :return:
+    :param convo: A pandas dataframe consisting of messages, sorted by datetime.
+    :param convo_times: A list of tuples containing the start and end times of conversations, as returned by
+        find_convo_times.
+    :return: A copy of the messages with the additional column "convo_idx", which is -1 for messages outside of all
+        conversations.
     """
-    def get_max_neg(df):
-        return max(df["sent_score"], key=lambda x: x["neg"])
+    datetimes = convo["datetime"].values.astype("datetime64[ns]")
 
-    def get_max_pos(df):
-        max(df["sent_score"], key=lambda x: x["pos"])
+    if not convo_times:
+        return convo.assign(convo_idx=np.full(len(convo), -1))
 
-    for (start, end) in convo_times:
-        time_range = pd.date_range(start=start, end=end, freq='1min')
-        cur_convo = convo[convo["datetime"].isin(time_range)]
+    starts = np.array([start for start, _ in convo_times], dtype="datetime64[ns]")
+    ends = np.array([end for _, end in convo_times], dtype="datetime64[ns]")
 
-        # vectorizer = TfidfVectorizer(input="content", encoding="UTF-8", analyzer="word", )
-        # tf_idf_scores = vectorizer.fit_transform(cur_convo['content'])
+    # Conversations do not overlap, so the last conversation starting before a message is the only candidate
+    positions = np.searchsorted(starts, datetimes, side="right") - 1
+    in_convo = (positions >= 0) & (datetimes <= ends[positions.clip(0)])
 
-        viable_msg = cur_convo[cur_convo["content"].map(lambda x: len(x.split(" "))) > 2]
-        most_pos = viable_msg[viable_msg["sent_score"] == get_max_pos(viable_msg)]
-        most_neg = viable_msg[viable_msg["sent_score"] == get_max_neg(viable_msg)]
+    # The chat may be shared with other analyses or come from the cache, so it is not modified
+    return convo.assign(convo_idx=np.where(in_convo, positions, -1))
 
-    return
+
+def top_tfidf_terms(documents, n=5, stop_words=STOP_WORDS):
+    """Finds the terms with the highest TF-IDF score of each document.
+
+    :param documents: A pandas Series of documents.
+    :param n: The number of terms to find per document.
+    :param stop_words: A set of words to leave out.
+    :return: A pandas Series with the same index as documents, containing lists of terms.
+    """
+    vectorizer = TfidfVectorizer(encoding="UTF-8", analyzer="word", stop_words=list(stop_words))
+
+    try:
+        tf_idf_scores = vectorizer.fit_transform(documents).tocsr()
+    except ValueError:
+        # Only stop words (or nothing at all) were written
+        return pd.Series([[] for _ in documents], index=documents.index)
+
+    terms = vectorizer.get_feature_names_out()
+    top_terms = []
+
+    for row in range(tf_idf_scores.shape[0]):
+        row_start, row_end = tf_idf_scores.indptr[row], tf_idf_scores.indptr[row + 1]
+        scores = tf_idf_scores.data[row_start:row_end]
+        indices = tf_idf_scores.indices[row_start:row_end]
+        top_terms.append(terms[indices[np.argsort(-scores, kind="stable")[:n]]].tolist())
+
+    return pd.Series(top_terms, index=documents.index)
+
+
+def analyse_convos(convo, convo_times, n_terms=5, min_words=3, language=None):
+    """Compute statistics of every conversation in one pass over all messages.
+
+    :param convo: A pandas dataframe consisting of messages, sorted by datetime.
+    :param convo_times: A list of tuples containing the start and end times of conversations, as returned by
+        find_convo_times.
+    :param n_terms: The number of top TF-IDF terms to find per conversation.
+    :param min_words: The minimum number of words a message needs to count as most positive/negative message.
+    :param language: The language of the stop words, a key of STOP_WORDS_BY_LANGUAGE. If None, it is detected.
+    :return: A dataframe indexed by conversation index, containing the duration, message rate (messages per minute),
+        initiator, response latencies (in seconds), turn count, sentiment statistics, top terms and emoji of each
+        conversation.
+    """
+    convo = assign_convo_idx(convo, convo_times)
+    msgs = convo[convo["convo_idx"] >= 0]
+
+    if msgs.empty:
+        return pd.DataFrame(columns=["start", "end", "duration", "msg_count", "msg_rate", "author_count", "initiator",
+                                     "turns", "median_latency", "mean_latency", "sent_mean", "sent_min", "sent_max",
+                                     "most_pos_msg", "most_neg_msg", "top_terms", "emoji_count", "top_emoji"])
+
+    has_sentiment = msgs["sent_score"].notna().all()
+    if has_sentiment:
+        scores = pd.DataFrame(msgs["sent_score"].tolist(), index=msgs.index)
+    else:
+        # Sentiment analysis was skipped
+        scores = pd.DataFrame(np.nan, index=msgs.index, columns=["compound", "pos", "neg"])
+
+    same_convo = msgs["convo_idx"].eq(msgs["convo_idx"].shift())
+    author_change = msgs["author"].ne(msgs["author"].shift()) & same_convo
+
+    msgs = msgs.assign(
+        author_change=author_change,
+        # A reply is the first message after the other author's message within the same conversation
+        latency=msgs["datetime"].diff().dt.total_seconds().where(author_change),
+        compound=scores["compound"],
+        pos=scores["pos"],
+        neg=scores["neg"],
+    )
+
+    grouped = msgs.groupby("convo_idx")
+    stats = grouped.agg(
+        start=("datetime", "min"),
+        end=("datetime", "max"),
+        msg_count=("author", "size"),
+        author_count=("author", "nunique"),
+        initiator=("author", "first"),
+        turns=("author_change", "sum"),
+        median_latency=("latency", "median"),
+        mean_latency=("latency", "mean"),
+        sent_mean=("compound", "mean"),
+        sent_min=("compound", "min"),
+        sent_max=("compound", "max"),
+    )
+    stats.insert(2, "duration", stats["end"] - stats["start"])
+    stats.insert(4, "msg_rate", stats["msg_count"] / (stats["duration"].dt.total_seconds() / 60).clip(lower=1))
+
+    if has_sentiment:
+        viable_msg = msgs[msgs["content"].str.split().str.len() >= min_words].groupby("convo_idx")
+        most_pos = viable_msg["pos"].idxmax()
+        most_neg = viable_msg["neg"].idxmax()
+        stats["most_pos_msg"] = pd.Series(msgs.loc[most_pos.values, "content"].values, index=most_pos.index)
+        stats["most_neg_msg"] = pd.Series(msgs.loc[most_neg.values, "content"].values, index=most_neg.index)
+    else:
+        stats["most_pos_msg"] = None
+        stats["most_neg_msg"] = None
+    stop_words, _ = get_stop_lists(language if language is not None else detect_language(convo))
+    stats["top_terms"] = top_tfidf_terms(grouped["content"].agg(" ".join), n=n_terms, stop_words=stop_words)
+
+    emoji_counts = pd.Series(count_emoji_by(msgs, "convo_idx"))
+    stats["emoji_count"] = emoji_counts.map(lambda x: sum(x.values()))
+    stats["top_emoji"] = emoji_counts.map(lambda x: [emoji for emoji, _ in x.most_common(n_terms)])
+
+    return stats
+
+
+def convo_reply_latencies(convo, convo_times):
+    """Compute the response latencies between each pair of authors in every conversation.
+
+    :param convo: A pandas dataframe consisting of messages, sorted by datetime.
+    :param convo_times: A list of tuples containing the start and end times of conversations, as returned by
+        find_convo_times.
+    :return: A dataframe indexed by conversation index, author and author replied to, containing the number of
+        replies and their median and mean latency (in seconds).
+    """
+    msgs = assign_convo_idx(convo, convo_times)
+    msgs = msgs[msgs["convo_idx"] >= 0]
+
+    # A reply is the first message after the other author's message within the same conversation, like in
+    # analyse_convos
+    author_change = msgs["author"].ne(msgs["author"].shift()) & msgs["convo_idx"].eq(msgs["convo_idx"].shift())
+    replies = msgs.assign(
+        replied_to=msgs["author"].shift(),
+        latency=msgs["datetime"].diff().dt.total_seconds(),
+    )[author_change]
+
+    return replies.groupby(["convo_idx", "author", "replied_to"])["latency"].agg(
+        replies="size",
+        median_latency="median",
+        mean_latency="mean",
+    )
 
 
 def find_convo_times(dataframe, msg_threshold=10):
@@ -48,19 +177,12 @@ def find_convo_times(dataframe, msg_threshold=10):
     :param msg_threshold: A threshold above which a conversation will be considered interesting.
     :return: A list of tuples containing the start and end times of interesting conversations.
     """
-    corrected_convos = dataframe.groupby("convo_idx").sum()[
-        dataframe.groupby("convo_idx").sum()["freq"] > msg_threshold]
-
-    convo_times = []
-
-    for idx in corrected_convos.index:
-        cur_convo = dataframe[dataframe["convo_idx"] == idx]
-        cur_convo_times = cur_convo["datetime"]
-        start = min(cur_convo_times)
-        end = max(cur_convo_times) + timedelta(minutes=4)
-        convo_times.append((start, end))
+    convo_sums = dataframe.groupby("convo_idx").agg(
+        freq=("freq", "sum"), start=("datetime", "min"), end=("datetime", "max"))
+    corrected_convos = convo_sums[convo_sums["freq"] > msg_threshold]
 
-    return convo_times
+    # Times were rounded down to 5 min, so the last interval ends 4 min later
+    return list(zip(corrected_convos["start"], corrected_convos["end"] + timedelta(minutes=4)))
 
 
 def index_conversations(dataframe, probs, change_threshold=0.95, clean=False):
@@ -125,15 +247,87 @@ def clean_latex_symbols(counter: Counter):
     return counter
 
 
-def analyse_msg(convo):
+def sketch_messages(messages, chunk_size=10000, k=1000, width=2**18, depth=4):
+    """Count words and characters of each author approximately, in bounded memory.
+
+    :param messages: An iterable of [author, datetime, media, content, sent_score] messages, e.g. from iter_messages.
+    :param chunk_size: The number of messages counted at once.
+    :param k: The number of most common words and characters tracked per author.
+    :param width: The width of the Count-Min sketches, shared by all authors.
+    :param depth: The depth of the Count-Min sketches.
+    :return: A tuple of the word and character TopKSketches, keyed by author.
+    """
+    word_sketches = TopKSketches(k=k, width=width, depth=depth)
+    char_sketches = TopKSketches(k=k, width=width, depth=depth)
+    messages = iter(messages)
+
+    # Only the sketches and a single chunk are held in memory at any time
+    while chunk := list(islice(messages, chunk_size)):
+        chunk_words = dict()
+        chunk_chars = dict()
+        for author, _, _, content, _ in chunk:
+            chunk_words.setdefault(author, []).extend(content.split())
+            chunk_chars.setdefault(author, []).append(content)
+
+        for author in chunk_words:
+            word_sketches.update(author, chunk_words[author])
+            char_sketches.update(author, split_graphemes(chunk_chars[author]))
+
+    return word_sketches, char_sketches
+
+
+def merge_sketches(all_sketches):
+    """Merge the sketches of several worker processes.
+
+    :param all_sketches: An iterable of tuples as returned by sketch_messages.
+    :return: A tuple of the word and character TopKSketches, keyed by author.
+    """
+    all_sketches = iter(all_sketches)
+    word_sketches, char_sketches = next(all_sketches)
+
+    for other_word_sketches, other_char_sketches in all_sketches:
+        word_sketches.merge(other_word_sketches)
+        char_sketches.merge(other_char_sketches)
+
+    return word_sketches, char_sketches
+
+
+def analyse_msg(convo, tmp_path=Path("TmpData"), extra_variables=None, sketches=None, language=None):
     """Analyse messages and write results to file.
 
     :param convo: A pandas dataframe consisting of messages.
+    :param tmp_path: The path where to save the variables of each author.
+    :param extra_variables: A dict of additional LaTeX variable definitions by author, computed by other analyses.
+    :param sketches: A tuple of the word and character TopKSketches by author, as returned by sketch_messages. If
+        given, they are used instead of counting all words and characters exactly.
+    :param language: The language of the stop lists, a key of STOP_WORDS_BY_LANGUAGE. If None, it is detected.
     :return: List of Author objects containing frequencies.
     """
     results = list()
     authors = set(convo["author"])
 
+    if sketches is not None:
+        # Words and characters were counted approximately while parsing
+        word_sketches, char_sketches = sketches
+        word_freq_counts = {author: word_sketches[author] for author in authors}
+        char_freq_counts = {author: char_sketches[author] for author in authors}
+    else:
+        word_freq_counts = dict()
+        char_freq_counts = dict()
+        for author, cur_author_messages in convo.groupby("author")["content"]:
+            # Words
+            word_freq_counts[author] = Counter(chain.from_iterable(map(str.split, cur_author_messages)))
+
+            # Characters, as perceived by the reader (e.g. an emoji with skin tone is one character)
+            char_freq_counts[author] = count_graphemes(cur_author_messages)
+
+    # Filter stop words and characters with masks over the vocabulary shared by all authors
+    stop_words, stop_chars = get_stop_lists(language if language is not None else detect_language(convo))
+    word_counts = TokenCounts.from_counters(word_freq_counts)
+    char_counts = TokenCounts.from_counters(char_freq_counts)
+    stop_word_mask = compile_stop_mask(word_counts.vocab, stop_words)
+    stop_char_mask = compile_stop_mask(char_counts.vocab, stop_chars)
+
     # Do the analysis for each author separately
     for author_idx, author in enumerate(authors):
         cur_author_frame = convo[convo['author'] == author]
@@ -143,15 +337,9 @@ def analyse_msg(convo):
         # Message length
         len_count = Counter(map(len, cur_author_messages))
 
-        # Words
-        word_freq_count = cur_author_frame["content"].apply(lambda x: x.split())
-        word_freq_count = Counter(reduce(operator.add, word_freq_count.to_list()))
-
-
-        # Characters
-        char_freq_count = Counter()
-        for msg_char_counter in map(Counter, cur_author_messages):
-            char_freq_count.update(msg_char_counter)
+        word_freq_count = word_freq_counts[author]
+        char_freq_count = char_freq_counts[author]
+        emoji_freq_count = count_emoji(char_freq_count)
 
         cur_author_datetimes = cur_author_frame['datetime'].to_list()
         # Time
@@ -165,7 +353,8 @@ def analyse_msg(convo):
                 len_count=len_count,
                 word_freq_count=word_freq_count,
                 time_freq_count=time_freq_count,
-                date_freq_count=date_freq_count
+                date_freq_count=date_freq_count,
+                emoji_freq_count=emoji_freq_count
             )
         )
 
@@ -179,21 +368,19 @@ def analyse_msg(convo):
         most_common_time = time_freq_count.most_common(1)[0]
         lest_common_time = list(time_freq_count.most_common())[-1]
 
-        most_common_words = word_freq_count.most_common(5)
-        most_common_words_corrected = Counter(
-            {k: c for k, c in word_freq_count.items() if k not in STOP_WORDS and k not in " "})
+        most_common_words = word_counts.most_common(author, 5)
+        most_common_words_corrected = Counter(dict(word_counts.most_common(author, 5, mask=stop_word_mask)))
         most_common_words_corrected = clean_latex_symbols(most_common_words_corrected)
         most_common_words_corrected = most_common_words_corrected.most_common(5)
 
-        most_common_chars = char_freq_count.most_common(5)
-        most_common_chars_corrected = Counter(
-            {k: c for k, c in char_freq_count.items() if k not in STOP_CHARS and k not in " "})
+        most_common_chars = char_counts.most_common(author, 5)
+        most_common_chars_corrected = Counter(dict(char_counts.most_common(author, 5, mask=stop_char_mask)))
         most_common_chars_corrected = clean_latex_symbols(most_common_chars_corrected)
         most_common_chars_corrected = most_common_chars_corrected.most_common(5)
 
 
 
-        with open(r".\TmpData\variables.tex", "w", encoding="UTF-8") as file:
+        with open(Path(tmp_path) / f"{author}_variables.tex", "w", encoding="UTF-8") as file:
             file.write(rf"""
 \newcommand\Name{{{author.split(" ")[0]}}}
 \newcommand\TotalMsgCount{{{len(cur_author_frame)}}}
@@ -218,6 +405,7 @@ def analyse_msg(convo):
 \newcommand\FrequencyPlotName{{All_frequency.pdf}}
 \newcommand\PosteriorPlotName{{All_frequency_posterior.pdf}}
 \newcommand\IdxConvoPlotName{{All_idx_convo.pdf}}
+\newcommand\SentPlotName{{All_sentiment.pdf}}
 
 
 \newcommand\MostMsgTimeHour{{{ most_common_time[0][0] }}}
@@ -251,7 +439,12 @@ def analyse_msg(convo):
 \newcommand\MostCommonCharCorrectedThree{{{ most_common_chars_corrected[2][0] }}}
 \newcommand\MostCommonCharCorrectedFour{{{ most_common_chars_corrected[3][0] }}}
 \newcommand\MostCommonCharCorrectedFive{{{ most_common_chars_corrected[4][0] }}}
+
+\newcommand\EmojiCount{{{ sum(emoji_freq_count.values()) }}}
+\newcommand\EmojiDistinctCount{{{ len(emoji_freq_count) }}}
         """)
+            if extra_variables is not None:
+                file.write(extra_variables.get(author, ""))
 
     return results
 
@@ -263,5 +456,5 @@ if __name__ == "__main__":
     # analyse_msg(convo)
     # indexed_convo = index_conversations(convo, change_threshold=0.95)
     # convo_times = find_convo_times(indexed_convo)
-    # analyse_convos(convo, convo_times)
+    # convo_stats = analyse_convos(convo, convo_times)
     pass
@@ -1,8 +1,22 @@
 import re
+from functools import lru_cache
 import pandas as pd
 from datetime import datetime
+from pathlib import Path
 from nltk.sentiment import SentimentIntensityAnalyzer
 
+# What WhatsApp writes instead of media files, depending on the language of the phone
+MEDIA_MARKERS = ("<Medien ausgeschlossen>", "<Media omitted>")
+
+
+@lru_cache(maxsize=None)
+def get_analyzer():
+    """Loads the sentiment analyzer once per process, as loading its lexicon takes a while.
+
+    :return: A SentimentIntensityAnalyzer.
+    """
+    return SentimentIntensityAnalyzer()
+
 
 def replace_short(content: str, short, full):
     if short in content.lower():
@@ -33,9 +47,14 @@ def clean_msg(content):
     return cur_content
 
 
-def convert(filepath):
+def iter_messages(filepath, sentiment=True):
+    """Parses a chat export one message at a time, without keeping the whole chat in memory.
+
+    :param filepath: The path of the exported chat.
+    :param sentiment: Whether to compute the sentiment scores of each message. If False, the score is None.
+    :return: A generator of [author, datetime, media, content, sent_score] lists.
+    """
     current_msg = None
-    msgs = []
     # The regEx to recognize the beginning of a message
     regStr = r"^\d\d.\d\d.\d\d, \d\d:\d\d.+?:."
 
@@ -43,7 +62,13 @@ def convert(filepath):
     idx = 0
 
     # Get sentiment analyzer
-    sia = SentimentIntensityAnalyzer()
+    sia = get_analyzer() if sentiment else None
+
+    def finish_msg(msg, content):
+        content = clean_msg(content)
+        msg.append(content[:-1].lower())
+        msg.append(sia.polarity_scores(content) if sia is not None else None)
+        return msg
 
     with open(filepath, encoding="utf-8") as f:
         while line := f.readline():
@@ -55,10 +80,7 @@ def convert(filepath):
             # Check if we found a beginning, if so, save the beginning (date, time, author) aka. we found a message
             if re.findall(regStr, line) != list():
                 if current_msg is not None:
-                    current = clean_msg(current)
-                    current_msg.append(current[:-1].lower())
-                    current_msg.append(sia.polarity_scores(current))
-                    msgs.append(current_msg)
+                    yield finish_msg(current_msg, current)
 
                 current_msg = []
                 current = line
@@ -71,7 +93,7 @@ def convert(filepath):
                 current = re.sub(regStr, "", current)
 
                 media = False
-                if "<Medien ausgeschlossen>" in current:
+                if any(marker in current for marker in MEDIA_MARKERS):
                     media = True
                     current = ""
 
@@ -92,15 +114,15 @@ def convert(filepath):
 
         else:
             if current_msg is not None:
-                current = clean_msg(current)
-                current_msg.append(current[:-1].lower())
-                current_msg.append(sia.polarity_scores(current))
-                msgs.append(current_msg)
+                yield finish_msg(current_msg, current)
+
 
+def convert(filepath, sentiment=True):
+    msgs = list(iter_messages(filepath, sentiment=sentiment))
     convo = pd.DataFrame(data=msgs, columns=["author", "datetime",  "media", "content", "sent_score"])
     return convo
 
 
 if __name__ == "__main__":
-    convo = convert(r".\Data\test.txt")
+    convo = convert(Path("Data") / "test.txt")
     print(convo)
@@ -1,32 +1,70 @@
-from utility.visualisation import plot_all_dates, plot_all_time, plot_frequency, plot_convo_idx, plot_freq_and_posterior
-from content_analysis import analyse_msg, index_conversations
-from extraction import convert
-from utility.stop_words import STOP_WORDS
-from utility.stop_chars import STOP_CHARS
-from utility.bca import get_bcp
-from tkinter import Tk
-from tkinter.filedialog import askopenfilename
-
-Tk().withdraw()
-file = askopenfilename()
-plot_path = r"./Plots"
-convo = convert(file)
-plot_all_dates(convo, plot_path, save=True)
-author_list = analyse_msg(convo)
-plot_all_time(author_list, plot_path, save=True)
-with open(f"{plot_path}/stop_words.txt", "w", encoding="UTF-8") as f:
-    f.write(
-        "\n".join(str(STOP_WORDS)[1:-1].split(","))
-    )
-
-with open(f"{plot_path}/stop_chars.txt", "w", encoding="UTF-8") as f:
-    f.write(
-        "\n".join(str(STOP_CHARS)[1:-1].split(","))
-    )
-
-frequency_df, (means, probs) = get_bcp(convo)
-plot_frequency(frequency_df, "All", plot_path, save=True)
-plot_freq_and_posterior(frequency_df, means, probs, "All", plot_path, save=True)
-indexed_convo = index_conversations(frequency_df, probs, change_threshold=0.95, clean=False)
-plot_convo_idx(indexed_convo, "All", plot_path, save=True)
+import argparse
+import sys
+from pathlib import Path
+from pipeline import STAGES, run_pipeline
+from utility.stop_words import STOP_WORDS_BY_LANGUAGE
 
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse exported WhatsApp chats and compile a report per author.")
+    parser.add_argument("inputs", nargs="*", type=Path,
+                        help="Exported chats. If none are given, a file selection window is opened.")
+    parser.add_argument("-o", "--output", type=Path, default=Path("Output"),
+                        help="Directory for the outputs, with one subdirectory per chat. (default: %(default)s)")
+    parser.add_argument("-s", "--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stages to run. (default: all)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of processes compiling reports. (default: one per CPU)")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="Directory for parsed chats and compiled reports. (default: OUTPUT/.cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the cache.")
+    parser.add_argument("--engine", default=None, help="LaTeX engine. (default: lualatex, else pdflatex)")
+    parser.add_argument("--sketch", action="store_true",
+                        help="Count words and characters approximately in bounded memory, for very large chats.")
+    parser.add_argument("--language", choices=STOP_WORDS_BY_LANGUAGE, default=None,
+                        help="Language of the stop lists. (default: detected)")
+
+    return parser.parse_args(argv)
+
+
+def select_file():
+    from tkinter import Tk
+    from tkinter.filedialog import askopenfilename
+
+    Tk().withdraw()
+    file = askopenfilename()
+    return [Path(file)] if file else []
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    inputs = args.inputs or select_file()
+    if not inputs:
+        print("No chat selected.", file=sys.stderr)
+        return 1
+
+    cache_path = None if args.no_cache else (args.cache_dir or args.output / ".cache")
+    failed = False
+
+    for input_path in inputs:
+        try:
+            builds = run_pipeline(input_path, args.output, stages=args.stages, workers=args.workers,
+                                  cache_path=cache_path, engine=args.engine, sketch=args.sketch,
+                                  language=args.language)
+        except Exception as e:
+            print(f"Analysis of {input_path} failed: {e!r}", file=sys.stderr)
+            failed = True
+            continue
+
+        for build in builds:
+            if build.failed:
+                print(f"Report of {build.author} failed:\n{build.log_excerpt}", file=sys.stderr)
+                failed = True
+            else:
+                print(f"Report of {build.author}: {build.pdf_path}{' (cached)' if build.cached else ''}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+import pandas as pd
+from content_analysis import analyse_msg, index_conversations, find_convo_times, analyse_convos, \
+    convo_reply_latencies, sketch_messages
+from extraction import convert, iter_messages
+from response_analysis import get_author_changes, reply_latencies, latency_stats, double_texting, \
+    get_response_variables
+from utility.filtering import detect_language, get_stop_lists
+from utility.visualisation import plot_all_dates, plot_all_time, plot_frequency, plot_convo_idx, \
+    plot_freq_and_posterior, plot_sentiment, plot_reply_latency
+from report import build_reports
+
+STAGES = ("parse", "sentiment", "bcp", "stats", "plots", "report")
+
+
+def get_output_paths(input_path, output_root):
+    """Creates the output directories of a chat, named after the chat file and a hash of its path.
+
+    :param input_path: The path of the exported chat.
+    :param output_root: The directory containing the outputs of all chats.
+    :return: A tuple of the plot, tmp data and report directories.
+    """
+    # Exports are all called _chat.txt, the hash keeps chats from different directories apart
+    path_hash = hashlib.sha256(str(Path(input_path).resolve()).encode("UTF-8")).hexdigest()[:8]
+    chat_path = Path(output_root) / f"{Path(input_path).stem}_{path_hash}"
+    paths = (chat_path / "Plots", chat_path / "TmpData", chat_path / "Reports")
+
+    for path in paths:
+        path.mkdir(parents=True, exist_ok=True)
+
+    return paths
+
+
+def load_convo(input_path, sentiment=True, cache_path=None):
+    """Parses a chat, or loads it from the cache if the same file was parsed before.
+
+    :param input_path: The path of the exported chat.
+    :param sentiment: Whether to compute the sentiment scores of each message.
+    :param cache_path: The path where parsed chats are cached. If None, nothing is cached.
+    :return: The conversation as pandas dataframe.
+    """
+    if cache_path is None:
+        return convert(input_path, sentiment=sentiment)
+
+    digest = hashlib.sha256(Path(input_path).read_bytes())
+    digest.update(f"sentiment={sentiment}".encode("UTF-8"))
+    cached_file = Path(cache_path) / f"{digest.hexdigest()}.pkl"
+
+    if cached_file.exists():
+        return pd.read_pickle(cached_file)
+
+    convo = convert(input_path, sentiment=sentiment)
+    Path(cache_path).mkdir(parents=True, exist_ok=True)
+
+    # Written next to the cached file and renamed, so other processes never read a partially written pickle
+    with tempfile.NamedTemporaryFile(dir=cache_path, prefix=f".{cached_file.name}.", suffix=".tmp",
+                                     delete=False) as tmp_file:
+        tmp_path = Path(tmp_file.name)
+
+    try:
+        convo.to_pickle(tmp_path)
+        os.replace(tmp_path, cached_file)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return convo
+
+
+def run_pipeline(input_path, output_root, stages=STAGES, workers=None, cache_path=None, engine=None, sketch=False,
+                 language=None, progress=print):
+    """Runs the selected stages of the analysis on a single chat.
+
+    :param input_path: The path of the exported chat.
+    :param output_root: The directory containing the outputs of all chats.
+    :param stages: The stages to run, a subset of STAGES. The chat is parsed whenever any stage needs it.
+    :param workers: The maximum number of processes compiling reports. If None, one per CPU is used.
+    :param cache_path: The path where parsed chats and compiled reports are cached. If None, nothing is cached.
+    :param engine: The LaTeX engine to compile with. If None, the first available one is used.
+    :param sketch: Whether to count words and characters approximately in bounded memory, reporting their error bounds
+        through progress.
+    :param language: The language of the stop lists. If None, it is detected.
+    :param progress: A function called with a message whenever a stage starts.
+    :return: A list of ReportBuild objects, empty if no reports were built.
+    """
+    unknown_stages = set(stages) - set(STAGES)
+    if unknown_stages:
+        raise ValueError(f"Unknown stages: {', '.join(sorted(unknown_stages))}")
+
+    plot_path, tmp_path, report_path = get_output_paths(input_path, output_root)
+    convo_cache_path = Path(cache_path) / "convos" if cache_path is not None else None
+    report_cache_path = Path(cache_path) / "reports" if cache_path is not None else None
+
+    progress(f"Parsing {input_path}")
+    convo = load_convo(input_path, sentiment="sentiment" in stages, cache_path=convo_cache_path)
+    if convo.empty:
+        raise ValueError(f"No messages found in {input_path}")
+
+    if language is None:
+        language = detect_language(convo)
+
+    author_list = None
+    if "stats" in stages:
+        progress("Computing statistics")
+        # Sorts and factorizes the whole chat, so it is done once for both analyses
+        author_changes = get_author_changes(convo)
+        replies, latency_histogram = reply_latencies(convo, author_changes=author_changes)
+        latency_stats(replies).to_csv(tmp_path / "reply_latencies.csv", encoding="UTF-8")
+        response_variables = get_response_variables(replies, double_texting(convo, author_changes=author_changes),
+                                                    list(set(convo["author"])))
+        sketches = None
+        if sketch:
+            # Counted straight from the parser, so no exact count of the whole vocabulary is ever held in memory
+            sketches = sketch_messages(iter_messages(input_path, sentiment=False))
+            word_sketches, char_sketches = sketches
+            for author in sorted(word_sketches.keys()):
+                progress(f"Word counts of {author} overcount by at most {word_sketches[author].error_bound():.0f}, "
+                         f"character counts by at most {char_sketches[author].error_bound():.0f}")
+        author_list = analyse_msg(convo, tmp_path, extra_variables=response_variables, sketches=sketches,
+                                  language=language)
+
+        stop_words, stop_chars = get_stop_lists(language)
+        with open(plot_path / "stop_words.txt", "w", encoding="UTF-8") as f:
+            f.write("\n".join(sorted(stop_words)))
+
+        with open(plot_path / "stop_chars.txt", "w", encoding="UTF-8") as f:
+            f.write("\n".join(sorted(stop_chars)))
+
+    if "plots" in stages:
+        progress("Plotting")
+        plot_all_dates(convo, plot_path, save=True)
+        if "sentiment" in stages:
+            plot_sentiment(convo, "All", plot_path, save=True)
+        if author_list is not None:
+            plot_reply_latency(latency_histogram, "All", plot_path, save=True)
+            plot_all_time(author_list, plot_path, save=True)
+
+    if "bcp" in stages:
+        # Imported here, so the other stages work without R
+        from utility.bca import get_bcp
+
+        progress("Running Bayesian change point analysis")
+        frequency_df, (means, probs) = get_bcp(convo)
+        indexed_convo = index_conversations(frequency_df, probs, change_threshold=0.95, clean=False)
+
+        if "plots" in stages:
+            plot_frequency(frequency_df, "All", plot_path, save=True)
+            plot_freq_and_posterior(frequency_df, means, probs, "All", plot_path, save=True)
+            plot_convo_idx(indexed_convo, "All", plot_path, save=True)
+
+        if "stats" in stages:
+            convo_times = find_convo_times(indexed_convo)
+            convo_stats = analyse_convos(convo, convo_times, language=language)
+            convo_stats.to_csv(tmp_path / "convo_stats.csv", encoding="UTF-8")
+            convo_reply_latencies(convo, convo_times).to_csv(tmp_path / "convo_reply_latencies.csv", encoding="UTF-8")
+
+    builds = []
+    if "report" in stages:
+        progress("Compiling reports")
+        builds = build_reports(sorted(set(convo["author"])), tmp_path, plot_path, report_path,
+                               cache_path=report_cache_path, engine=engine, workers=workers)
+
+    return builds
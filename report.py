@@ -0,0 +1,218 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+LAYOUT_PATH = Path(__file__).parent / "Layout"
+LAYOUT_FILES = ("template.tex", "WAReport.cls")
+APPENDIX_FILES = ("stop_words.txt", "stop_chars.txt")
+ENGINES = ("lualatex", "pdflatex")
+PLOT_NAME_REGEX = r"\\newcommand\\\w+PlotName\{(.+?)\}"
+
+
+class ReportBuild:
+    def __init__(self, author, pdf_path=None, cached=False, log_excerpt=None):
+        self.author = author
+        self.pdf_path = pdf_path
+        self.cached = cached
+        self.log_excerpt = log_excerpt
+
+    @property
+    def failed(self):
+        return self.pdf_path is None
+
+
+def find_engine(engine=None):
+    """Finds a locally installed LaTeX engine.
+
+    :param engine: The name of the engine to use. If None, the first available engine of ENGINES is used.
+    :return: The path to the engine executable.
+    """
+    for name in [engine] if engine is not None else ENGINES:
+        engine_path = shutil.which(name)
+        if engine_path is not None:
+            return engine_path
+
+    raise FileNotFoundError(f"No LaTeX engine found, tried: {engine or ', '.join(ENGINES)}")
+
+
+def get_plot_files(variables):
+    """Finds all files in the plot directory a report depends on.
+
+    :param variables: The content of an author's variables.tex file.
+    :return: A sorted list of file names.
+    """
+    return sorted(set(re.findall(PLOT_NAME_REGEX, variables)) | set(APPENDIX_FILES))
+
+
+def hash_inputs(variables, plot_path, engine, layout_path=LAYOUT_PATH):
+    """Computes a hash over everything that goes into a report: the variables, the plots, the engine and the layout
+    files.
+
+    :param variables: The content of an author's variables.tex file.
+    :param plot_path: The path where the plots are saved.
+    :param engine: The LaTeX engine the report is compiled with.
+    :param layout_path: The path where the template and class file are saved.
+    :return: A hex digest identifying the report.
+    """
+    digest = hashlib.sha256()
+    digest.update(variables.encode("UTF-8"))
+    digest.update(Path(engine).name.encode("UTF-8"))
+
+    for file in LAYOUT_FILES:
+        digest.update((Path(layout_path) / file).read_bytes())
+
+    for file in get_plot_files(variables):
+        plot_file = Path(plot_path) / file
+        digest.update(file.encode("UTF-8"))
+        digest.update(plot_file.read_bytes() if plot_file.exists() else b"missing")
+
+    return digest.hexdigest()
+
+
+def copy_file_atomic(source, target):
+    """Copies a file, so the target is either missing or complete, even if the process is killed while copying.
+
+    :param source: The path of the file to copy.
+    :param target: The path to copy to.
+    :return: None.
+    """
+    # A temporary file in the same directory is on the same file system, so it can be renamed atomically
+    with tempfile.NamedTemporaryFile(dir=Path(target).parent, prefix=f".{Path(target).name}.", suffix=".tmp",
+                                     delete=False) as tmp_file:
+        tmp_path = Path(tmp_file.name)
+
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def get_log_excerpt(log, context=5, max_lines=30):
+    """Extracts the error messages of a LaTeX log.
+
+    :param log: The content of the log.
+    :param context: The number of lines to keep after each error.
+    :param max_lines: The maximum number of lines of the excerpt.
+    :return: The lines around each error or, if no error was found, the end of the log.
+    """
+    lines = log.splitlines()
+    excerpt = []
+
+    for idx, line in enumerate(lines):
+        if line.startswith("!"):
+            excerpt.extend(lines[idx:idx + context + 1])
+
+    if not excerpt:
+        excerpt = lines[-max_lines:]
+
+    return "\n".join(excerpt[:max_lines])
+
+
+def build_report(author, variables_file, plot_path, out_path, cache_path=None, engine="lualatex", passes=2,
+                 timeout=300):
+    """Compiles the report of a single author in an isolated temporary directory.
+
+    :param author: The name of the author.
+    :param variables_file: The variables.tex file written for this author by analyse_msg.
+    :param plot_path: The path where the plots are saved.
+    :param out_path: The path where to save the report.
+    :param cache_path: The path where compiled reports are cached. If None, nothing is cached.
+    :param engine: The LaTeX engine to compile with.
+    :param passes: How often to run the engine, so references and page numbers are resolved.
+    :param timeout: The maximum number of seconds a single pass may take.
+    :return: A ReportBuild object.
+    """
+    variables = Path(variables_file).read_text(encoding="UTF-8")
+    report_file = Path(out_path) / f"{author}_report.pdf"
+
+    key = hash_inputs(variables, plot_path, engine)
+    if cache_path is not None:
+        cached_file = Path(cache_path) / f"{key}.pdf"
+        if cached_file.exists():
+            copy_file_atomic(cached_file, report_file)
+            return ReportBuild(author, report_file, cached=True)
+
+    with tempfile.TemporaryDirectory(prefix="wa_report_") as tmp_dir:
+        # The template expects the layout, variables and plots side by side, like in the repository
+        layout_dir = Path(tmp_dir) / "Layout"
+        tmp_data_dir = Path(tmp_dir) / "TmpData"
+        plot_dir = Path(tmp_dir) / "Plots"
+        for directory in (layout_dir, tmp_data_dir, plot_dir):
+            directory.mkdir()
+
+        for file in LAYOUT_FILES:
+            shutil.copyfile(LAYOUT_PATH / file, layout_dir / file)
+        (tmp_data_dir / "variables.tex").write_text(variables, encoding="UTF-8")
+        for file in get_plot_files(variables):
+            if (Path(plot_path) / file).exists():
+                shutil.copyfile(Path(plot_path) / file, plot_dir / file)
+
+        for _ in range(passes):
+            try:
+                result = subprocess.run(
+                    [engine, "-interaction=nonstopmode", "-halt-on-error", "template.tex"],
+                    cwd=layout_dir, capture_output=True, text=True, encoding="UTF-8", errors="replace",
+                    timeout=timeout
+                )
+            except subprocess.TimeoutExpired:
+                return ReportBuild(author, log_excerpt=f"{engine} timed out after {timeout} seconds")
+
+            if result.returncode != 0:
+                log_file = layout_dir / "template.log"
+                log = log_file.read_text(encoding="UTF-8", errors="replace") if log_file.exists() else result.stdout
+                return ReportBuild(author, log_excerpt=get_log_excerpt(log))
+
+        Path(out_path).mkdir(parents=True, exist_ok=True)
+        copy_file_atomic(layout_dir / "template.pdf", report_file)
+
+    if cache_path is not None:
+        Path(cache_path).mkdir(parents=True, exist_ok=True)
+        copy_file_atomic(report_file, Path(cache_path) / f"{key}.pdf")
+
+    return ReportBuild(author, report_file)
+
+
+def build_reports(authors, tmp_path, plot_path, out_path, cache_path=None, engine=None, workers=None):
+    """Compiles the reports of all authors in a pool of worker processes.
+
+    :param authors: The names of all authors to build a report for.
+    :param tmp_path: The path where analyse_msg saved the variables of each author.
+    :param plot_path: The path where the plots are saved.
+    :param out_path: The path where to save the reports.
+    :param cache_path: The path where compiled reports are cached. If None, nothing is cached.
+    :param engine: The LaTeX engine to compile with. If None, the first available engine of ENGINES is used.
+    :param workers: The maximum number of worker processes. If None, one per CPU is used.
+    :return: A list of ReportBuild objects, one per author.
+    """
+    engine = find_engine(engine)
+    Path(out_path).mkdir(parents=True, exist_ok=True)
+
+    builds = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(build_report, author, Path(tmp_path) / f"{author}_variables.tex", plot_path, out_path,
+                            cache_path=cache_path, engine=engine): author
+            for author in authors
+        }
+
+        for future in as_completed(futures):
+            try:
+                builds.append(future.result())
+            except Exception as e:
+                builds.append(ReportBuild(futures[future], log_excerpt=repr(e)))
+
+    return sorted(builds, key=lambda x: x.author)
+
+
+if __name__ == "__main__":
+    # builds = build_reports(["Name"], "./TmpData", "./Plots", "./Reports", cache_path="./Reports/.cache")
+    # for build in builds:
+    #     print(build.author, build.pdf_path, build.log_excerpt)
+    pass
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+# Edges of the latency histogram in seconds. Times only have minute resolution, so the first bin holds all replies
+# within the same minute and the last one everything slower than a week.
+LATENCY_BINS = np.concatenate([[0], np.geomspace(60, 7 * 24 * 60 * 60, 30)])
+
+
+class LatencyHistogram:
+    """Histogram of reply latencies of each pair of authors, which can be updated chunk by chunk."""
+
+    def __init__(self, authors, bins=LATENCY_BINS):
+        self.authors = np.asarray(authors)
+        self.bins = bins
+        # Indexed by replying author, author replied to and latency bin
+        self.counts = np.zeros((len(authors), len(authors), len(bins)), dtype=np.int64)
+
+    def update(self, author_codes, replied_to_codes, latencies):
+        """Adds replies to the histogram.
+
+        :param author_codes: An array of the indices (into authors) of the replying authors.
+        :param replied_to_codes: An array of the indices (into authors) of the authors replied to.
+        :param latencies: An array of the reply latencies in seconds.
+        :return: None.
+        """
+        bin_idx = np.searchsorted(self.bins, latencies, side="right") - 1
+        np.add.at(self.counts, (author_codes, replied_to_codes, bin_idx), 1)
+
+    def merge(self, other):
+        """Adds the counts of another histogram over the same authors and bins.
+
+        :param other: A LatencyHistogram.
+        :return: self.
+        """
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q):
+        """Approximates a quantile of the latencies of each author, regardless of whom they replied to.
+
+        :param q: The quantile, between 0 and 1.
+        :return: A pandas Series of the upper bin edges containing the quantile, indexed by author.
+        """
+        counts = self.counts.sum(axis=1)
+        cum_counts = counts.cumsum(axis=1)
+        bin_idx = (cum_counts < q * cum_counts[:, -1:]).sum(axis=1)
+        upper_edges = np.append(self.bins[1:], np.inf)
+
+        return pd.Series(np.where(cum_counts[:, -1] > 0, upper_edges[bin_idx.clip(max=len(self.bins) - 1)], np.nan),
+                         index=self.authors)
+
+
+def get_author_changes(convo):
+    """Computes gaps between consecutive messages and where the author changes.
+
+    :param convo: A pandas dataframe consisting of messages.
+    :return: A tuple of the author index of each message, the author names, the gaps between consecutive messages in
+        seconds and whether the author changed between consecutive messages.
+    """
+    msgs = convo.sort_values("datetime", kind="stable")
+    codes, authors = pd.factorize(msgs["author"], sort=True)
+    times = msgs["datetime"].values.astype("datetime64[s]").astype(np.int64)
+
+    gaps = np.diff(times)
+    changes = np.diff(codes) != 0
+
+    return codes, np.asarray(authors), gaps, changes
+
+
+def reply_latencies(convo, max_latency=12 * 60 * 60, author_changes=None):
+    """Finds all replies and how long they took.
+
+    :param convo: A pandas dataframe consisting of messages.
+    :param max_latency: The maximum number of seconds after which a message still counts as a reply.
+    :param author_changes: The result of get_author_changes for convo. If None, it is computed.
+    :return: A tuple of a dataframe with the columns "author", "replied_to" and "latency" (in seconds) and a
+        LatencyHistogram of all replies.
+    """
+    codes, authors, gaps, changes = author_changes if author_changes is not None else get_author_changes(convo)
+    is_reply = changes & (gaps <= max_latency)
+
+    author_codes = codes[1:][is_reply]
+    replied_to_codes = codes[:-1][is_reply]
+    latencies = gaps[is_reply]
+
+    histogram = LatencyHistogram(authors)
+    histogram.update(author_codes, replied_to_codes, latencies)
+
+    replies = pd.DataFrame({
+        "author": authors[author_codes],
+        "replied_to": authors[replied_to_codes],
+        "latency": latencies,
+    })
+
+    return replies, histogram
+
+
+def latency_stats(replies):
+    """Computes the latency distribution of each pair of authors.
+
+    :param replies: A dataframe of replies as returned by reply_latencies.
+    :return: A dataframe indexed by author and author replied to, with count, mean, std, min, percentiles and max of
+        the latencies in seconds.
+    """
+    return replies.groupby(["author", "replied_to"])["latency"].describe(percentiles=[0.25, 0.5, 0.75, 0.9])
+
+
+def double_texting(convo, author_changes=None):
+    """Computes how many messages each author sends in a row without anyone replying.
+
+    :param convo: A pandas dataframe consisting of messages.
+    :param author_changes: The result of get_author_changes for convo. If None, it is computed.
+    :return: A dataframe indexed by author with the number of runs, the mean and max run length and the number of runs
+        with more than one message.
+    """
+    codes, authors, _, changes = author_changes if author_changes is not None else get_author_changes(convo)
+
+    run_starts = np.concatenate([[0], np.flatnonzero(changes) + 1])
+    run_lengths = np.diff(np.append(run_starts, len(codes)))
+
+    runs = pd.DataFrame({"author": authors[codes[run_starts]], "length": run_lengths})
+    runs["double_text"] = runs["length"] > 1
+
+    return runs.groupby("author").agg(
+        runs=("length", "size"),
+        mean_run=("length", "mean"),
+        max_run=("length", "max"),
+        double_texts=("double_text", "sum"),
+    )
+
+
+def get_response_variables(replies, run_stats, authors):
+    """Creates the LaTeX variables of the response statistics of each author.
+
+    :param replies: A dataframe of replies as returned by reply_latencies.
+    :param run_stats: A dataframe of run statistics as returned by double_texting.
+    :param authors: The names of all authors.
+    :return: A dict of LaTeX variable definitions by author.
+    """
+    reply_stats = replies.groupby("author")["latency"].agg(["size", "median"]).reindex(authors)
+    run_stats = run_stats.reindex(authors)
+
+    variables = dict()
+    for author in authors:
+        reply_count, median_latency = reply_stats.loc[author]
+        variables[author] = rf"""
+\newcommand\ReplyCount{{{int(reply_count) if pd.notna(reply_count) else 0}}}
+\newcommand\MedianReplyTime{{{round(median_latency / 60, 1) if pd.notna(median_latency) else "--"}}}
+\newcommand\DoubleTextCount{{{int(run_stats.loc[author, "double_texts"])}}}
+\newcommand\MaxDoubleText{{{int(run_stats.loc[author, "max_run"])}}}
+\newcommand\ReplyPlotName{{All_reply_latency.pdf}}
+"""
+
+    return variables
+
+
+if __name__ == "__main__":
+    # from extraction import convert
+    # convo = convert(filename)
+    # replies, histogram = reply_latencies(convo)
+    # print(latency_stats(replies))
+    # print(double_texting(convo))
+    pass
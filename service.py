@@ -0,0 +1,464 @@
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+from pipeline import STAGES
+
+# Progress queue of a worker process, set by init_worker
+_events = None
+
+STATUS_MESSAGES = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def init_worker(events):
+    """Loads everything an analysis needs once, when a worker process starts.
+
+    :param events: The queue progress messages are put into.
+    :return: None.
+    """
+    global _events
+    _events = events
+
+    import matplotlib
+    matplotlib.use("Agg")
+    # Imports pandas, sklearn and the plotting stack
+    importlib.import_module("pipeline")
+    from extraction import get_analyzer
+    get_analyzer()
+
+    try:
+        from utility.bca import get_bcp_package
+        get_bcp_package()
+    except Exception as e:
+        # Jobs without the bcp stage still work
+        print(f"R could not be loaded, the bcp stage will fail: {e!r}", file=sys.stderr)
+
+
+def warm_up():
+    """Does nothing, submitting it makes the pool start a worker process."""
+    return None
+
+
+def run_job(job_id, input_path, output_root, stages, cache_path, report_workers):
+    """Runs the pipeline of a single job in a worker process.
+
+    :param job_id: The id of the job, sent along with every progress message.
+    :param input_path: The path of the uploaded export.
+    :param output_root: The directory for the outputs of this job.
+    :param stages: The stages to run.
+    :param cache_path: The path of the cache shared by all jobs.
+    :param report_workers: The number of processes compiling reports.
+    :return: A list of (author, log excerpt) tuples of all reports which failed to compile.
+    """
+    from pipeline import run_pipeline
+
+    try:
+        builds = run_pipeline(input_path, output_root, stages=stages, workers=report_workers, cache_path=cache_path,
+                              progress=lambda message: _events.put((job_id, message)))
+    finally:
+        # Marks the end of this job's progress messages, which may arrive after its result
+        _events.put((job_id, None))
+
+    return [(build.author, build.log_excerpt) for build in builds if build.failed]
+
+
+class Job:
+    def __init__(self, job_id, name, stages, input_path, output_path):
+        self.id = job_id
+        self.name = name
+        self.stages = stages
+        self.input_path = input_path
+        self.output_path = output_path
+        self.status = "queued"
+        self.events = []
+        self.artifacts = []
+        self.report_failures = []
+        self.error = None
+        self.updated = asyncio.Condition()
+        self.drained = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "stages": self.stages,
+            "status": self.status,
+            "events": self.events,
+            "artifacts": self.artifacts,
+            "report_failures": [{"author": author, "log": log} for author, log in self.report_failures],
+            "error": self.error,
+        }
+
+
+class AnalysisService:
+    """Accepts chat exports over HTTP and analyses them in a pool of warm worker processes.
+
+    Endpoints:
+        POST /jobs?name=NAME&stages=STAGE,STAGE  upload an export as request body, returns the job id
+        GET /jobs                                list all jobs
+        GET /jobs/ID                             status, progress and artifacts of a job
+        GET /jobs/ID/events                      stream progress as JSON lines until the job is finished
+        GET /jobs/ID/artifacts/PATH              download an artifact, e.g. a report
+    """
+
+    def __init__(self, root, workers=2, report_workers=2, max_upload_size=1024**3, max_finished_jobs=100):
+        self.root = Path(root)
+        self.cache_path = self.root / "cache"
+        self.workers = workers
+        self.report_workers = report_workers
+        self.max_upload_size = max_upload_size
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = dict()
+        # The event loop only keeps weak references to tasks, so running watchers are kept here
+        self.watchers = set()
+
+        self.events = multiprocessing.Queue()
+        self.executor = self.create_executor()
+
+    def create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self.events,))
+
+    def replace_executor(self, broken_executor):
+        """Replaces a pool which is broken, e.g. because a worker segfaulted in R or was killed for lack of memory.
+
+        :param broken_executor: The broken pool. If it was replaced already, nothing happens.
+        :return: None.
+        """
+        # All jobs of the broken pool fail at once, only the first of their watchers replaces it
+        if self.executor is broken_executor:
+            print("A worker process died, restarting the pool", file=sys.stderr)
+            broken_executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.create_executor()
+
+    async def update(self, job, event=None, **changes):
+        async with job.updated:
+            if event is not None:
+                job.events.append(event)
+            for key, value in changes.items():
+                setattr(job, key, value)
+            job.updated.notify_all()
+
+    async def pump_events(self):
+        loop = asyncio.get_running_loop()
+
+        while (event := await loop.run_in_executor(None, self.events.get)) is not None:
+            job_id, message = event
+            if job_id not in self.jobs:
+                continue
+
+            if message is None:
+                self.jobs[job_id].drained.set()
+            else:
+                await self.update(self.jobs[job_id], event=message, status="running")
+
+    async def watch(self, job, executor, future, drain_timeout=10):
+        try:
+            report_failures = await asyncio.wrap_future(future)
+        except Exception as e:
+            report_failures = None
+            error = e
+            if isinstance(e, BrokenProcessPool):
+                self.replace_executor(executor)
+
+        try:
+            # A crashed worker never sends the end of its progress messages
+            await asyncio.wait_for(job.drained.wait(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        if report_failures is None:
+            await self.update(job, status="failed", error=repr(error))
+        else:
+            artifacts = await asyncio.to_thread(
+                lambda: sorted(path.relative_to(job.output_path).as_posix()
+                               for path in job.output_path.rglob("*") if path.is_file())
+            )
+            await self.update(job, event="Done", status="failed" if report_failures else "done",
+                              artifacts=artifacts, report_failures=report_failures)
+
+        await self.expire_jobs()
+
+    async def expire_jobs(self):
+        """Deletes the oldest finished jobs, their outputs and uploads no other job uses, beyond max_finished_jobs.
+
+        :return: None.
+        """
+        finished_jobs = [job for job in self.jobs.values() if job.finished]
+        expired_jobs = finished_jobs[:max(len(finished_jobs) - self.max_finished_jobs, 0)]
+        # Removed before deleting any files, so concurrent calls do not expire the same jobs again
+        for job in expired_jobs:
+            del self.jobs[job.id]
+
+        for job in expired_jobs:
+            await asyncio.to_thread(shutil.rmtree, job.output_path, ignore_errors=True)
+
+            if all(other.input_path != job.input_path for other in self.jobs.values()):
+                await asyncio.to_thread(shutil.rmtree, job.input_path.parent, ignore_errors=True)
+
+    async def receive_upload(self, reader, length, name, chunk_size=2**20):
+        """Streams an uploaded export to disk in chunks, so it is never held in memory as a whole.
+
+        :param reader: The stream of the request body.
+        :param length: The length of the request body.
+        :param name: The name of the chat, used for the file name.
+        :param chunk_size: The number of bytes read and written at once.
+        :return: The path of the saved export.
+        """
+        upload_path = self.root / "uploads"
+        await asyncio.to_thread(upload_path.mkdir, parents=True, exist_ok=True)
+        tmp_file = await asyncio.to_thread(tempfile.NamedTemporaryFile, dir=upload_path, suffix=".tmp", delete=False)
+        digest = hashlib.sha256()
+
+        def write_chunk(chunk):
+            digest.update(chunk)
+            tmp_file.write(chunk)
+
+        try:
+            with tmp_file:
+                remaining = length
+                while remaining > 0:
+                    chunk = await reader.readexactly(min(chunk_size, remaining))
+                    await asyncio.to_thread(write_chunk, chunk)
+                    remaining -= len(chunk)
+
+            # Identical uploads share one file, so the cached parse of an earlier job is reused
+            input_path = upload_path / digest.hexdigest() / f"{name}.txt"
+            await asyncio.to_thread(input_path.parent.mkdir, exist_ok=True)
+            await asyncio.to_thread(os.replace, tmp_file.name, input_path)
+        except BaseException:
+            await asyncio.to_thread(Path(tmp_file.name).unlink, missing_ok=True)
+            raise
+
+        return input_path
+
+    def submit(self, name, input_path, stages):
+        """Queues the analysis of an uploaded export.
+
+        :param name: The name of the chat.
+        :param input_path: The path of the export, as returned by receive_upload.
+        :param stages: The stages to run.
+        :return: The new Job.
+        """
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, name, stages, input_path, self.root / "jobs" / job_id)
+        self.jobs[job_id] = job
+
+        executor = self.executor
+        try:
+            future = executor.submit(run_job, job_id, input_path, job.output_path, stages, self.cache_path,
+                                     self.report_workers)
+        except BrokenProcessPool:
+            self.replace_executor(executor)
+            executor = self.executor
+            future = executor.submit(run_job, job_id, input_path, job.output_path, stages, self.cache_path,
+                                     self.report_workers)
+        watcher = asyncio.create_task(self.watch(job, executor, future))
+        self.watchers.add(watcher)
+        watcher.add_done_callback(self.watchers.discard)
+
+        return job
+
+    async def send(self, writer, status, body, content_type="application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body).encode("UTF-8")
+
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_MESSAGES[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1")
+        )
+        writer.write(body)
+        await writer.drain()
+
+    async def send_file(self, writer, path, chunk_size=2**20):
+        size = (await asyncio.to_thread(path.stat)).st_size
+        writer.write(
+            f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: application/octet-stream\r\n"
+            f"Content-Length: {size}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1")
+        )
+
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            while chunk := await asyncio.to_thread(f.read, chunk_size):
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            f.close()
+
+    async def stream_events(self, writer, job):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+
+        sent = 0
+        while True:
+            async with job.updated:
+                await job.updated.wait_for(lambda: len(job.events) > sent or job.finished)
+                events = job.events[sent:]
+                finished = job.finished
+
+            for event in events:
+                line = json.dumps({"id": job.id, "event": event}).encode("UTF-8") + b"\n"
+                writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+            sent += len(events)
+            await writer.drain()
+
+            if finished:
+                line = json.dumps(job.to_dict()).encode("UTF-8") + b"\n"
+                writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n0\r\n\r\n")
+                await writer.drain()
+                return
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+            headers = dict()
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            url = urlsplit(target)
+            parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+            query = parse_qs(url.query)
+
+            if not parts or parts[0] != "jobs":
+                await self.send(writer, 404, {"error": "Unknown endpoint"})
+
+            elif len(parts) == 1 and method == "POST":
+                if "content-length" not in headers:
+                    await self.send(writer, 411, {"error": "Content-Length is required"})
+                    return
+                length = int(headers["content-length"])
+                if length > self.max_upload_size:
+                    await self.send(writer, 413, {"error": f"Uploads are limited to {self.max_upload_size} bytes"})
+                    return
+
+                stages = query.get("stages", [",".join(STAGES)])[0].split(",")
+                if set(stages) - set(STAGES):
+                    await self.send(writer, 400, {"error": f"Stages must be of {', '.join(STAGES)}"})
+                    return
+
+                name = Path(query.get("name", ["chat"])[0]).stem or "chat"
+                job = self.submit(name, await self.receive_upload(reader, length, name), stages)
+                await self.send(writer, 202, {"id": job.id})
+
+            elif method != "GET":
+                await self.send(writer, 405, {"error": "Method not allowed"})
+
+            elif len(parts) == 1:
+                await self.send(writer, 200, [
+                    {"id": job.id, "name": job.name, "status": job.status} for job in self.jobs.values()])
+
+            elif parts[1] not in self.jobs:
+                await self.send(writer, 404, {"error": "Unknown job"})
+
+            elif len(parts) == 2:
+                await self.send(writer, 200, self.jobs[parts[1]].to_dict())
+
+            elif len(parts) == 3 and parts[2] == "events":
+                await self.stream_events(writer, self.jobs[parts[1]])
+
+            elif len(parts) > 3 and parts[2] == "artifacts":
+                job = self.jobs[parts[1]]
+                artifact = "/".join(parts[3:])
+                if artifact not in job.artifacts:
+                    await self.send(writer, 404, {"error": "Unknown artifact"})
+                    return
+                await self.send_file(writer, job.output_path / artifact)
+
+            else:
+                await self.send(writer, 404, {"error": "Unknown endpoint"})
+
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            await self.send(writer, 400, {"error": repr(e)})
+        except ConnectionError:
+            pass
+        except Exception as e:
+            await self.send(writer, 500, {"error": repr(e)})
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, socket_path=None):
+        """Starts the workers and answers requests until cancelled.
+
+        :param host: The host to listen on.
+        :param port: The port to listen on.
+        :param socket_path: A Unix socket to listen on instead of host and port.
+        :return: None.
+        """
+        # Start all workers now, so the first jobs do not wait for them to load
+        await asyncio.gather(*[asyncio.wrap_future(self.executor.submit(warm_up)) for _ in range(self.workers)])
+        pump = asyncio.create_task(self.pump_events())
+
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+
+        print(f"Listening on {socket_path or f'http://{host}:{port}'}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.events.put(None)
+            await pump
+            self.executor.shutdown(cancel_futures=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse WhatsApp chats as a service with warm worker processes.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on. (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on. (default: %(default)s)")
+    parser.add_argument("--socket", type=Path, default=None, help="Unix socket to listen on instead of host and port.")
+    parser.add_argument("--root", type=Path, default=Path("Service"),
+                        help="Directory for uploads, outputs and the cache. (default: %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, default=2,
+                        help="Number of jobs analysed at once. (default: %(default)s)")
+    parser.add_argument("--report-workers", type=int, default=2,
+                        help="Number of processes compiling reports per job. (default: %(default)s)")
+    parser.add_argument("--max-finished-jobs", type=int, default=100,
+                        help="Number of finished jobs kept, older ones are deleted with their outputs. "
+                             "(default: %(default)s)")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = AnalysisService(args.root, workers=args.workers, report_workers=args.report_workers,
+                              max_finished_jobs=args.max_finished_jobs)
+
+    try:
+        asyncio.run(service.serve(args.host, args.port, socket_path=args.socket))
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,8 @@
 class Author:
-    def __init__(self, name, len_count, word_freq_count, time_freq_count, date_freq_count):
+    def __init__(self, name, len_count, word_freq_count, time_freq_count, date_freq_count, emoji_freq_count=None):
         self.name = name
         self.msg_len_count = len_count
         self.word_freq_count = word_freq_count
         self.time_freq_count = time_freq_count
         self.date_freq_count = date_freq_count
+        self.emoji_freq_count = emoji_freq_count
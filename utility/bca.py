@@ -1,4 +1,5 @@
 import numpy as np
+from functools import lru_cache
 from rpy2.robjects.packages import importr
 import rpy2.robjects as robjects
 import pandas as pd
@@ -37,9 +38,18 @@ def prep_individual(convo):
         yield prep_data(convo[convo['author'] == author]["datetime"])
 
 
+@lru_cache(maxsize=None)
+def get_bcp_package():
+    """Imports the R package once per process, as booting R takes a while.
+
+    :return: The bcp package.
+    """
+    return importr('bcp') #import bayesian change point package in python
+
+
 def bcp(data):
     r = robjects.r #allows access to r object with r.
-    bcp = importr('bcp') #import bayesian change point package in python
+    bcp = get_bcp_package()
 
     np_cv_rules = default_converter + numpy2ri.converter
 
@@ -0,0 +1,108 @@
+from itertools import chain
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utility.stop_words import STOP_WORDS_BY_LANGUAGE
+from utility.stop_chars import STOP_CHARS_BY_LANGUAGE
+
+DEFAULT_LANGUAGE = "en"
+
+
+class TokenCounts:
+    """Counts of each author and token over a vocabulary shared by all authors."""
+
+    def __init__(self, vocab, authors, counts):
+        self.vocab = vocab
+        self.authors = list(authors)
+        # Sparse authors x vocab matrix
+        self.counts = counts
+
+    @classmethod
+    def from_counters(cls, counters):
+        """Maps the Counters of all authors onto one shared vocabulary.
+
+        :param counters: A dict of Counters (or objects with an items method, like TopKSketch) by author.
+        :return: A TokenCounts object.
+        """
+        all_items = [list(counter.items()) for counter in counters.values()]
+        tokens = np.fromiter((token for token, _ in chain.from_iterable(all_items)), dtype=object)
+        values = np.fromiter((c for _, c in chain.from_iterable(all_items)), dtype=np.int64)
+        rows = np.repeat(np.arange(len(all_items)), [len(items) for items in all_items])
+
+        token_ids, vocab = pd.factorize(tokens)
+        counts = sparse.csr_matrix((values, (rows, token_ids)), shape=(len(all_items), len(vocab)))
+
+        return cls(vocab, counters.keys(), counts)
+
+    def totals(self):
+        """Sums the counts of all authors.
+
+        :return: An array of counts per token id.
+        """
+        return np.asarray(self.counts.sum(axis=0)).ravel()
+
+    def most_common(self, author, n, mask=None):
+        """Lists the most common tokens of an author, like Counter.most_common.
+
+        :param author: The name of the author.
+        :param n: The number of tokens to list.
+        :param mask: A boolean array over the vocabulary of tokens to leave out, as returned by compile_stop_mask.
+        :return: A list of (token, count) tuples.
+        """
+        row = self.authors.index(author)
+        row_start, row_end = self.counts.indptr[row], self.counts.indptr[row + 1]
+        token_ids = self.counts.indices[row_start:row_end]
+        values = self.counts.data[row_start:row_end]
+
+        if mask is not None:
+            keep = ~mask[token_ids]
+            token_ids, values = token_ids[keep], values[keep]
+
+        if len(values) > n:
+            top = np.argpartition(-values, n)[:n]
+            token_ids, values = token_ids[top], values[top]
+
+        order = np.argsort(-values, kind="stable")
+        return [(self.vocab[token_id], int(c)) for token_id, c in zip(token_ids[order], values[order])]
+
+
+def compile_stop_mask(vocab, stop_list):
+    """Compiles a stop list into a mask over a vocabulary.
+
+    :param vocab: An array of all tokens.
+    :param stop_list: A set of tokens to leave out.
+    :return: A boolean array, True for every token which is in the stop list or only whitespace.
+    """
+    vocab = pd.Series(vocab, dtype=object)
+    return (vocab.isin(stop_list) | vocab.str.isspace().fillna(False)).to_numpy(dtype=bool)
+
+
+def detect_language(convo, sample_size=10000):
+    """Detects the language of a chat by the share of stop words of each language.
+
+    :param convo: A pandas dataframe consisting of messages.
+    :param sample_size: The number of messages to look at. If None, all messages are used.
+    :return: A key of STOP_WORDS_BY_LANGUAGE.
+    """
+    sample = convo["content"] if sample_size is None else convo["content"].iloc[:sample_size]
+    word_counts = sample.str.split().explode().dropna().value_counts()
+
+    if word_counts.empty:
+        return DEFAULT_LANGUAGE
+
+    stop_word_counts = {
+        language: word_counts.values[compile_stop_mask(word_counts.index, stop_words)].sum()
+        for language, stop_words in STOP_WORDS_BY_LANGUAGE.items()
+    }
+    language = max(stop_word_counts, key=stop_word_counts.get)
+
+    return language if stop_word_counts[language] > 0 else DEFAULT_LANGUAGE
+
+
+def get_stop_lists(language):
+    """Looks up the stop words and stop characters of a language.
+
+    :param language: A key of STOP_WORDS_BY_LANGUAGE.
+    :return: A tuple of the stop words and stop characters.
+    """
+    return STOP_WORDS_BY_LANGUAGE[language], STOP_CHARS_BY_LANGUAGE[language]
@@ -0,0 +1,73 @@
+from collections import Counter
+from itertools import islice
+import regex
+
+# Extended grapheme clusters, i.e. what a reader perceives as one character (e.g. a flag or an emoji with skin tone)
+GRAPHEME_REGEX = regex.compile(r"\X")
+# A cluster is an emoji if it is displayed as one by default, is requested as one by the variation selector U+FE0F,
+# is a keycap (U+20E3) or is a flag, i.e. a pair of regional indicators. Symbols like (c), (r) or !! are text by default.
+EMOJI_REGEX = regex.compile(r"\p{Emoji_Presentation}|[\uFE0F\u20E3]|^\p{Regional_Indicator}{2}$")
+# Joins the messages of a chunk, so clusters cannot span two messages. It is a cluster of its own and never part of a
+# message.
+SEPARATOR = "\x00"
+
+
+def split_graphemes(texts):
+    """Splits texts into extended grapheme clusters, all at once.
+
+    :param texts: A list of strings.
+    :return: A list of all grapheme clusters of all texts.
+    """
+    joined = SEPARATOR.join(texts)
+
+    # Without carriage returns, every ASCII code point is a cluster of its own
+    if joined.isascii() and "\r" not in joined:
+        clusters = list(joined)
+    else:
+        clusters = GRAPHEME_REGEX.findall(joined)
+
+    return [cluster for cluster in clusters if cluster != SEPARATOR]
+
+
+def count_graphemes(texts, chunk_size=10000):
+    """Counts the extended grapheme clusters of texts, chunk by chunk.
+
+    :param texts: An iterable of strings.
+    :param chunk_size: The number of texts split at once.
+    :return: A Counter of grapheme clusters.
+    """
+    grapheme_count = Counter()
+    texts = iter(texts)
+
+    while chunk := list(islice(texts, chunk_size)):
+        grapheme_count.update(split_graphemes(chunk))
+
+    return grapheme_count
+
+
+def is_emoji(cluster):
+    """Checks whether a grapheme cluster is displayed as an emoji.
+
+    :param cluster: A single extended grapheme cluster.
+    :return: True if the cluster is an emoji.
+    """
+    return EMOJI_REGEX.search(cluster) is not None
+
+
+def count_emoji(grapheme_count: Counter):
+    """Keeps only the emoji of a Counter of grapheme clusters.
+
+    :param grapheme_count: A Counter of grapheme clusters.
+    :return: A Counter of emoji.
+    """
+    return Counter({cluster: c for cluster, c in grapheme_count.items() if is_emoji(cluster)})
+
+
+def count_emoji_by(convo, column):
+    """Counts the emoji of each group of messages.
+
+    :param convo: A pandas dataframe consisting of messages.
+    :param column: The column to group by, e.g. "author" or "convo_idx".
+    :return: A dict of emoji Counters by group.
+    """
+    return {key: count_emoji(count_graphemes(texts)) for key, texts in convo.groupby(column)["content"]}
@@ -0,0 +1,246 @@
+import hashlib
+import heapq
+from collections import Counter
+import numpy as np
+
+
+class CountMinSketch:
+    """Approximate counts of arbitrarily many items in a fixed width x depth table.
+
+    Estimates never undercount. With probability 1 - exp(-depth) they overcount by at most e / width * total.
+    """
+
+    def __init__(self, width=2**16, depth=4):
+        self.width = width
+        self.depth = depth
+        # 32 bit counts suffice for any chat and halve the size of the table
+        self.table = np.zeros((depth, width), dtype=np.int32)
+        self.total = 0
+
+    def _columns(self, item):
+        # Python's hash() is salted per process, which would make sketches of different workers incompatible
+        digest = hashlib.blake2b(item.encode("UTF-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def update(self, counts: Counter):
+        """Adds the counts of a chunk of items.
+
+        :param counts: A Counter of items.
+        :return: None.
+        """
+        if not counts:
+            return
+
+        columns = np.array([self._columns(item) for item in counts], dtype=np.int64)
+        rows = np.broadcast_to(np.arange(self.depth), columns.shape)
+        values = np.broadcast_to(np.fromiter(counts.values(), dtype=self.table.dtype, count=len(counts))[:, None],
+                                 columns.shape)
+
+        np.add.at(self.table, (rows, columns), values)
+        self.total += sum(counts.values())
+
+    def estimate(self, item):
+        """Estimates the count of an item.
+
+        :param item: The item.
+        :return: An upper bound of its count.
+        """
+        return int(self.table[np.arange(self.depth), self._columns(item)].min())
+
+    def error_bound(self):
+        """Computes the error guarantee of all estimates.
+
+        :return: A tuple of the maximal overcount and the probability of an estimate exceeding it.
+        """
+        return np.e / self.width * self.total, np.exp(-self.depth)
+
+    def merge(self, other):
+        """Adds the counts of another sketch of the same shape.
+
+        :param other: A CountMinSketch.
+        :return: self.
+        """
+        if self.table.shape != other.table.shape:
+            raise ValueError(f"Cannot merge sketches of shape {self.table.shape} and {other.table.shape}")
+
+        self.table += other.table
+        self.total += other.total
+        return self
+
+
+class SpaceSaving:
+    """The k most frequent items of a stream, tracked with at most k counters.
+
+    Each count overcounts by at most its error, which is at most total / k.
+    """
+
+    def __init__(self, k=100):
+        self.k = k
+        self.counts = dict()
+        self.errors = dict()
+        self.total = 0
+
+    def _min_count(self):
+        # Items which are not tracked by a full summary may have been seen up to min count times
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def _merge(self, counts, errors, min_count, total):
+        own_min_count = self._min_count()
+        merged_counts = dict()
+        merged_errors = dict()
+
+        for item in self.counts.keys() | counts.keys():
+            merged_counts[item] = self.counts.get(item, own_min_count) + counts.get(item, min_count)
+            merged_errors[item] = self.errors.get(item, own_min_count) + errors.get(item, min_count)
+
+        top_items = heapq.nlargest(self.k, merged_counts, key=merged_counts.get)
+        self.counts = {item: merged_counts[item] for item in top_items}
+        self.errors = {item: merged_errors[item] for item in top_items}
+        self.total += total
+
+    def update(self, counts: Counter):
+        """Adds the counts of a chunk of items.
+
+        :param counts: A Counter of items.
+        :return: None.
+        """
+        # The chunk's counts are exact, so they are a summary without any error
+        self._merge(counts, dict(), 0, sum(counts.values()))
+
+    def merge(self, other):
+        """Adds the counts of another summary.
+
+        :param other: A SpaceSaving object.
+        :return: self.
+        """
+        self._merge(other.counts, other.errors, other._min_count(), other.total)
+        return self
+
+
+class TopKSketch:
+    """Bounded-memory replacement for a Counter, supporting most_common over the k most frequent items.
+
+    Candidates are tracked by a SpaceSaving summary, their counts are the tighter estimate of the summary and a
+    CountMinSketch. The CountMinSketch may be shared with other sketches, each counting its items under its own key.
+    """
+
+    def __init__(self, k=100, width=2**16, depth=4, count_min=None, key=""):
+        self.count_min = count_min if count_min is not None else CountMinSketch(width=width, depth=depth)
+        self.key = key
+        self.heavy_hitters = SpaceSaving(k=k)
+
+    @property
+    def total(self):
+        return self.heavy_hitters.total
+
+    def _count_min_item(self, item):
+        # Items never contain a null character, so keys cannot be confused with each other
+        return f"{self.key}\x00{item}" if self.key else item
+
+    def update(self, items):
+        """Adds a chunk of items.
+
+        :param items: An iterable of items.
+        :return: None.
+        """
+        counts = Counter(items)
+        self.count_min.update({self._count_min_item(item): c for item, c in counts.items()})
+        self.heavy_hitters.update(counts)
+
+    def merge(self, other):
+        """Adds the counts of another sketch of the same shape, e.g. of another worker process.
+
+        Sketches sharing a CountMinSketch are merged by TopKSketches.merge instead, which adds each table only once.
+
+        :param other: A TopKSketch.
+        :return: self.
+        """
+        self.count_min.merge(other.count_min)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        return self
+
+    def __getitem__(self, item):
+        estimate = self.count_min.estimate(self._count_min_item(item))
+        if item in self.heavy_hitters.counts:
+            return min(self.heavy_hitters.counts[item], estimate)
+        return estimate
+
+    def items(self):
+        return [(item, self[item]) for item in self.heavy_hitters.counts]
+
+    def most_common(self, n=None):
+        """Lists the most common items and their estimated counts, like Counter.most_common.
+
+        :param n: The number of items to list. If None, all candidates are listed.
+        :return: A list of (item, count) tuples.
+        """
+        return sorted(self.items(), key=lambda x: x[1], reverse=True)[:n]
+
+    def error_bound(self, item=None):
+        """Computes how much an estimated count may exceed the true count.
+
+        :param item: The item. If None, the bound holding for all candidates is computed.
+        :return: The maximal overcount.
+        """
+        # Items of all sketches sharing the CountMinSketch collide, so its bound depends on their total
+        count_min_error, _ = self.count_min.error_bound()
+
+        if item is None:
+            return min(self.heavy_hitters.total / self.heavy_hitters.k, count_min_error)
+        if item in self.heavy_hitters.errors:
+            return min(self.heavy_hitters.errors[item], count_min_error)
+
+        return count_min_error
+
+
+class TopKSketches:
+    """A TopKSketch per key, e.g. per author, all sharing one CountMinSketch.
+
+    Only the SpaceSaving summaries grow with the number of keys, each by at most k counters.
+    """
+
+    def __init__(self, k=100, width=2**18, depth=4):
+        self.k = k
+        self.count_min = CountMinSketch(width=width, depth=depth)
+        self.sketches = dict()
+
+    def __getitem__(self, key):
+        return self.sketches[key]
+
+    def __contains__(self, key):
+        return key in self.sketches
+
+    def keys(self):
+        return self.sketches.keys()
+
+    def get_sketch(self, key):
+        """Looks up the sketch of a key, creating it if it does not exist yet.
+
+        :param key: The key, e.g. the name of an author.
+        :return: A TopKSketch.
+        """
+        if key not in self.sketches:
+            self.sketches[key] = TopKSketch(k=self.k, count_min=self.count_min, key=key)
+        return self.sketches[key]
+
+    def update(self, key, items):
+        """Adds a chunk of items of a key.
+
+        :param key: The key, e.g. the name of an author.
+        :param items: An iterable of items.
+        :return: None.
+        """
+        self.get_sketch(key).update(items)
+
+    def merge(self, other):
+        """Adds the counts of other sketches of the same shape, e.g. of another worker process.
+
+        :param other: A TopKSketches object.
+        :return: self.
+        """
+        self.count_min.merge(other.count_min)
+        for key, sketch in other.sketches.items():
+            self.get_sketch(key).heavy_hitters.merge(sketch.heavy_hitters)
+        return self
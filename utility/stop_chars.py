@@ -33,5 +33,10 @@ STOP_CHARS = set(
     ’
     ‘
     "
-    """
-)
\ No newline at end of file
+    """.split()
+)
+
+STOP_CHARS_BY_LANGUAGE = {
+    "en": STOP_CHARS,
+    "de": STOP_CHARS | {"ä", "ö", "ü", "ß"},
+}
@@ -48,3 +48,39 @@ STOP_WORDS.update(contractions)
 for apostrophe in ["‘", "’"]:
     for stopword in contractions:
         STOP_WORDS.add(stopword.replace("'", apostrophe))
+
+STOP_WORDS_DE = set(
+    """
+aber alle allem allen aller alles als also am an ander andere anderem anderen anderer anderes anderm andern anders
+auch auf aus
+bei beim bin bis bist bitte
+da dabei dadurch dafür dagegen daher dahin damals damit danach daneben dann daran darauf daraus darf darfst darin
+darüber darum darunter das dass daß davon davor dazu dein deine deinem deinen deiner deines dem demselben den denen
+denn dennoch denselben der deren derer derselbe derselben des deshalb desselben dessen dich die dies diese dieselbe
+dieselben diesem diesen dieser dieses dir doch dort du durch dürfen
+ein eine einem einen einer eines einige einigem einigen einiger einiges einmal er es etwa etwas euch euer eure eurem
+euren eurer eures
+für
+gar gegen gewesen gibt ging gleich
+hab habe haben hast hat hatte hatten hätte hätten her hier hin hinter
+ich ihm ihn ihnen ihr ihre ihrem ihren ihrer ihres im immer in indem ins ist
+ja jede jedem jeden jeder jedes jedoch jemand jene jenem jenen jener jenes jetzt
+kann kannst kein keine keinem keinen keiner keines können könnte
+mal man manche manchem manchen mancher manches mehr mein meine meinem meinen meiner meines mich mir mit muss musst
+musste müssen
+nach nachdem nicht nichts noch nun nur
+ob oder ohne
+schon sehr sein seine seinem seinen seiner seines seit selbst sich sie sind so solche solchem solchen solcher solches
+soll sollen sollte sondern sonst
+über um und uns unser unsere unserem unseren unserer unseres unter
+viel vom von vor
+wann war waren warst warum was weil weiter welche welchem welchen welcher welches wenn wer werde werden wie wieder
+will wir wird wirst wo wollen wollte würde würden
+zu zum zur zwar zwischen
+""".split()
+)
+
+STOP_WORDS_BY_LANGUAGE = {
+    "en": STOP_WORDS,
+    "de": STOP_WORDS_DE,
+}
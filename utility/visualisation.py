@@ -1,4 +1,5 @@
 import calplot
+from pathlib import Path
 import pandas as pd
 from collections import Counter
 import numpy as np
@@ -41,7 +42,7 @@ def plot_sentiment(dataframe, msg_author, path, save=True):
 
 
     if save:
-        plt.savefig(rf"{path}\{msg_author}_idx_convo.pdf", bbox_inches='tight', transparent=True)
+        plt.savefig(Path(path) / f"{msg_author}_sentiment.pdf", bbox_inches='tight', transparent=True)
     else:
         plt.show()
 
@@ -82,7 +83,7 @@ def plot_convo_idx(dataframe, msg_author, path, save=True):
 
 
     if save:
-        plt.savefig(rf"{path}\{msg_author}_idx_convo.pdf", bbox_inches='tight', transparent=True)
+        plt.savefig(Path(path) / f"{msg_author}_idx_convo.pdf", bbox_inches='tight', transparent=True)
     else:
         plt.show()
 
@@ -122,7 +123,7 @@ def plot_freq_and_posterior(dataframe, means, probs, msg_author, path, save=True
     fig.autofmt_xdate()
 
     if save:
-        plt.savefig(rf"{path}\{msg_author}_frequency_posterior.pdf", bbox_inches='tight', transparent=True)
+        plt.savefig(Path(path) / f"{msg_author}_frequency_posterior.pdf", bbox_inches='tight', transparent=True)
     else:
         plt.show()
 
@@ -154,7 +155,45 @@ def plot_frequency(dataframe, msg_author, path, save=True):
 
 
     if save:
-        plt.savefig(rf"{path}\{msg_author}_frequency.pdf", bbox_inches='tight', transparent=True)
+        plt.savefig(Path(path) / f"{msg_author}_frequency.pdf", bbox_inches='tight', transparent=True)
+
+    plt.clf()
+
+
+def plot_reply_latency(histogram, msg_author, path, save=True):
+    """
+    Plots the distribution of reply latencies of each author.
+
+    :param histogram: A LatencyHistogram of all replies.
+    :param msg_author: The author of all messages.
+    :param path: The path where to save the plot.
+    :param save: Whether to save the plot.
+    :return: None.
+    """
+    fig, ax = plt.subplots()
+
+    # Replies within the same minute are drawn at 30 seconds, so they fit on a log scale
+    bin_centers = np.append([30], np.sqrt(histogram.bins[1:-1] * histogram.bins[2:]))
+    bin_centers = np.append(bin_centers, histogram.bins[-1])
+
+    medians = histogram.quantile(0.5)
+    for author, counts in zip(histogram.authors, histogram.counts.sum(axis=1)):
+        if counts.sum() > 0:
+            line, = plt.plot(bin_centers / 60, counts / counts.sum(), label=author, drawstyle="steps-mid")
+            # Upper edge of the bin containing the median reply time
+            if np.isfinite(medians[author]):
+                plt.axvline(medians[author] / 60, color=line.get_color(), linestyle=":")
+
+    ax.set_xscale("log")
+    plt.title(f"Reply Times of {msg_author}")
+    plt.xlabel("Minutes until Reply")
+    plt.ylabel("Share of Replies")
+    plt.legend()
+
+    if save:
+        plt.savefig(Path(path) / f"{msg_author}_reply_latency.pdf", bbox_inches='tight', transparent=True)
+    else:
+        plt.show()
 
     plt.clf()
 
@@ -194,7 +233,7 @@ def plot_dates(dates, msg_author, path, save=True):
     if not save:
         plt.show(transparent=True)
     else:
-        plt.savefig(rf"{path}\{msg_author}_dates.pdf", bbox_inches='tight', transparent=True)
+        plt.savefig(Path(path) / f"{msg_author}_dates.pdf", bbox_inches='tight', transparent=True)
 
     plt.clf()
 
@@ -250,7 +289,7 @@ def plot_time(time_frequency, msg_author, path, save=True):
     if not save:
         plt.show(transparent=True)
     else:
-        plt.savefig(rf"{path}\{msg_author}_times.pdf", bbox_inches='tight', transparent=True)
+        plt.savefig(Path(path) / f"{msg_author}_times.pdf", bbox_inches='tight', transparent=True)
 
     plt.clf(); plt.cla(); plt.close()
 